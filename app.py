@@ -1,7 +1,16 @@
+import gc
+import logging
+import os
 import dash
+from flask import request
 import dash_bootstrap_components as dbc
 from layouts import layout
 from callbacks import register_callbacks
+from metrics import register_metrics_endpoint
+from data_processing import warm_caches
+
+# Log records of the app's modules, pipeline stages are logged as one JSON object per line
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'), format="%(asctime)s %(levelname)s %(name)s %(message)s")
 
 # Initialize Dash app with Bootstrap theme
 app = dash.Dash(
@@ -13,12 +22,34 @@ app = dash.Dash(
 # Expose the server for Gunicorn
 server = app.server
 
+# Map marker icons are loaded by every rendered map: let browsers keep them for a week
+@server.after_request
+def cache_map_icons(response):
+    if request.path.startswith(app.get_asset_url('images/')):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = 7 * 24 * 3600
+    return response
+
+# Prometheus metrics of the pipeline stages, see metrics.py
+register_metrics_endpoint(server)
+
 # Define the app layout
 app.layout = layout
 
 # Register callbacks
 register_callbacks(app)
 
+# Load the heavy libraries and fill the caches now rather than in every background job,
+# which forks from this process. Under gunicorn --preload this runs once, before the
+# workers fork, and they all share it. WARM_CACHES=0 leaves it to the first request.
+if os.environ.get('WARM_CACHES', '1') != '0':
+    warm_caches()
+
+# Everything allocated so far lives as long as the process: keep the garbage collector
+# off it, so forked workers and jobs don't copy the pages they share to update GC headers
+gc.freeze()
+
 # Run the app
 if __name__ == "__main__":
     app.run_server(debug=False)
@@ -0,0 +1,118 @@
+"""
+Headless batch mode: simulate many GPX routes against many rider configurations.
+
+    python batch.py routes/*.gpx --ftp 200 250 300 --strategy zone2 push_hard --output results.parquet
+
+Each route is parsed once and simulated for every configuration in one sweep; routes
+are spread over a process pool. Results are written as CSV, or as Parquet when the
+output ends in .parquet (requires pyarrow).
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from data_processing import read_gpx, build_dataframe, simulate_sweep, PACING_MODELS, SMOOTHING_METHODS
+from simulation import INTEGRATORS
+
+# Rider and bike parameters used when a sweep does not set them, same as the app defaults
+DEFAULT_CONFIG = {
+    'ftp': 240,
+    'bike_mass': 11,
+    'rider_mass': 88,
+    'C_r': 0.0036,
+    'C_d': 0.55,
+    'A': 0.6,
+    'rho': 1.225,
+    'strategy': 'zone1',
+}
+
+# Every combination of the given parameter values, on top of the defaults
+def config_grid(**values):
+    unknown = set(values) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+    names = list(values)
+    return [
+        {**DEFAULT_CONFIG, **dict(zip(names, combination))}
+        for combination in itertools.product(*(values[name] for name in names))
+    ]
+
+# Parse one route and simulate it for every configuration in one sweep
+def simulate_route(path, configs, method='fixed', tolerance=1e-4, merge_tolerance=None, smoothing=None, smoothing_window=None):
+    try:
+        data = build_dataframe(read_gpx(path), smoothing=smoothing, smoothing_window=smoothing_window)
+        results = simulate_sweep(data, configs, method=method, tolerance=tolerance, merge_tolerance=merge_tolerance)
+    except ValueError as e:
+        return [{'route': path, 'error': str(e)}]
+
+    results.insert(0, 'route', path)
+    results.insert(1, 'distance_km', data['Cumulative Distance (m)'].iloc[-1] / 1000)
+    return results.to_dict('records')
+
+# Simulate every route for every configuration, fanning routes out over a process pool
+def simulate_routes(paths, configs, workers=None, method='fixed', tolerance=1e-4, merge_tolerance=None,
+                    smoothing=None, smoothing_window=None):
+    configs = list(configs) or [dict(DEFAULT_CONFIG)]
+    if workers == 1:
+        results = [
+            simulate_route(path, configs, method, tolerance, merge_tolerance, smoothing, smoothing_window)
+            for path in paths
+        ]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(
+                simulate_route, paths, itertools.repeat(configs), itertools.repeat(method), itertools.repeat(tolerance),
+                itertools.repeat(merge_tolerance), itertools.repeat(smoothing), itertools.repeat(smoothing_window),
+            ))
+    return pd.DataFrame([row for rows in results for row in rows])
+
+def write_results(results, output):
+    if output.endswith('.parquet'):
+        results.to_parquet(output, index=False)
+    else:
+        results.to_csv(output, index=False)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate GPX routes for a grid of rider configurations.")
+    parser.add_argument('routes', nargs='+', help="GPX files to simulate")
+    parser.add_argument('--ftp', type=float, nargs='+', help="Functional Threshold Power values (W)")
+    parser.add_argument('--bike-mass', type=float, nargs='+', help="Bike mass values (kg)")
+    parser.add_argument('--rider-mass', type=float, nargs='+', help="Rider mass values (kg)")
+    parser.add_argument('--rolling-coeff', dest='C_r', type=float, nargs='+', help="Rolling resistance coefficients")
+    parser.add_argument('--drag-coeff', dest='C_d', type=float, nargs='+', help="Drag coefficients")
+    parser.add_argument('--frontal-area', dest='A', type=float, nargs='+', help="Frontal areas (m²)")
+    parser.add_argument('--air-density', dest='rho', type=float, nargs='+', help="Air densities (kg/m³)")
+    parser.add_argument('--strategy', nargs='+', choices=list(PACING_MODELS), help="Pacing strategies")
+    parser.add_argument('--method', choices=list(INTEGRATORS), default='fixed', help="Integration scheme")
+    parser.add_argument('--tolerance', type=float, default=1e-4, help="Relative error tolerance of the adaptive scheme")
+    parser.add_argument('--merge-tolerance', type=float, default=None,
+                        help="Simulate runs of segments whose gradients are within this many percent as one segment")
+    parser.add_argument('--smoothing', choices=list(SMOOTHING_METHODS), default=None, help="Elevation smoothing method")
+    parser.add_argument('--smoothing-window', type=float, default=None, help="Smoothing window (m), default per method")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument('--output', default='results.csv', help="Output file, .csv or .parquet")
+    args = parser.parse_args(argv)
+
+    sweep = {name: getattr(args, name) for name in DEFAULT_CONFIG if getattr(args, name) is not None}
+    configs = config_grid(**sweep)
+
+    start = time.perf_counter()
+    results = simulate_routes(
+        args.routes, configs, args.workers, args.method, args.tolerance, args.merge_tolerance,
+        args.smoothing, args.smoothing_window,
+    )
+    elapsed = time.perf_counter() - start
+    write_results(results, args.output)
+
+    workers = args.workers or os.cpu_count()
+    print(f"{len(args.routes)} routes x {len(configs)} configurations in {elapsed:.1f} s "
+          f"({len(args.routes) / elapsed / workers:.2f} routes/s per core), written to {args.output}",
+          file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
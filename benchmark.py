@@ -0,0 +1,246 @@
+"""
+Benchmark of every pipeline stage on synthetic GPX routes, and on any GPX files given.
+
+    python benchmark.py --sizes 1000 10000 100000 --output results.json
+    python benchmark.py --baseline results.json --threshold 0.25
+    python benchmark.py --sizes --startup
+
+Synthetic routes are generated from a fixed seed, so every run times the same input.
+Each stage is timed as the app runs it, best of --repeat runs. Results are written as
+JSON. With --baseline, every stage is compared with the same route and stage in
+an earlier result file, and the run fails (exit status 1) when one is slower by more
+than the threshold.
+
+With --startup, the app is also imported in fresh interpreters and the import time of
+each of its modules and heavy dependencies is reported, with the time warm_caches takes.
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from data_processing import (
+    parse_gpx, calculate_final_data, build_dataframe, visualize_data, visualize_map, simulate_sweep, warm_caches,
+)
+from batch import DEFAULT_CONFIG
+
+# Elevation profiles of the synthetic routes: gradient (%) as a function of the distance (m)
+GRADIENT_PROFILES = {
+    'flat': lambda distance: np.zeros_like(distance),
+    'rolling': lambda distance: 4 * np.sin(distance / 1500),
+    'climbs': lambda distance: np.where((distance // 10000) % 2 == 0, 7.0, -6.0),
+}
+
+# GPX file of a synthetic route: points every spacing (m) on average, heading drifting at
+# random, elevation following the gradient profile plus Gaussian noise (m)
+def synthetic_gpx(points, spacing=8.0, profile='rolling', noise=0.0, seed=0):
+    if profile not in GRADIENT_PROFILES:
+        raise ValueError(f"Unknown gradient profile '{profile}'")
+    rng = np.random.default_rng(seed)
+    steps = rng.uniform(0.5, 1.5, points) * spacing
+    steps[0] = 0.0
+    headings = 0.3 + np.cumsum(rng.uniform(-0.05, 0.05, points))
+    distance = np.cumsum(steps)
+    latitudes = 45.0 + np.cumsum(steps * np.cos(headings)) / 111000
+    longitudes = 7.0 + np.cumsum(steps * np.sin(headings) / (111000 * np.cos(np.radians(latitudes))))
+    elevations = 300 + np.cumsum(steps * GRADIENT_PROFILES[profile](distance) / 100)
+    elevations += rng.normal(0, noise, points) if noise else 0
+
+    track = '\n'.join(
+        f'<trkpt lat="{lat:.7f}" lon="{lon:.7f}"><ele>{ele:.1f}</ele></trkpt>'
+        for lat, lon, ele in zip(latitudes.tolist(), longitudes.tolist(), elevations.tolist())
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<gpx version="1.1" creator="benchmark" xmlns="http://www.topografix.com/GPX/1/1">'
+        f'<trk><name>{profile} {points}</name><trkseg>\n{track}\n</trkseg></trk></gpx>\n'
+    ).encode('utf-8')
+
+# Upload contents of a GPX file, as dcc.Upload hands it to the app
+def upload_contents(gpx_bytes):
+    return 'data:application/gpx+xml;base64,' + base64.b64encode(gpx_bytes).decode('ascii')
+
+# The pipeline stages, in order; each takes the upload contents and the output of the stages before it
+STAGES = {
+    'parse': lambda contents, state: parse_gpx(contents),
+    'distance': lambda contents, state: calculate_final_data(*state['parse']),
+    'dataframe': lambda contents, state: build_dataframe(state['parse']),
+    'profile': lambda contents, state: visualize_data(state['dataframe']).to_dict(),
+    'map': lambda contents, state: visualize_map(state['dataframe']),
+    'simulation': lambda contents, state: simulate_sweep(state['dataframe'], [DEFAULT_CONFIG]),
+}
+
+# Stages whose output each stage needs
+PREREQUISITES = {
+    'distance': ['parse'],
+    'dataframe': ['parse'],
+    'profile': ['dataframe'],
+    'map': ['dataframe'],
+    'simulation': ['dataframe'],
+}
+
+def best_time(function, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        runs.append(time.perf_counter() - start)
+    return result, runs
+
+# Time every stage on one route, best of repeat runs
+def benchmark_route(name, gpx_bytes, stages=tuple(STAGES), repeat=5):
+    contents = upload_contents(gpx_bytes)
+    needed = set(stages)
+    for stage in reversed(list(STAGES)):
+        if stage in needed:
+            needed.update(PREREQUISITES.get(stage, []))
+    state = {}
+    results = []
+    for stage in STAGES:
+        if stage not in needed:
+            continue
+        # Stages left out still run once when a later stage needs their output
+        if stage not in stages:
+            state[stage] = STAGES[stage](contents, state)
+            continue
+        state[stage], runs = best_time(lambda: STAGES[stage](contents, state), repeat)
+        results.append({
+            'route': name,
+            'points': len(state['parse'][0]),
+            'bytes': len(gpx_bytes),
+            'stage': stage,
+            'seconds': min(runs),
+            'runs': runs,
+        })
+        print(f"{name:>20} {stage:>10} {min(runs) * 1000:10.1f} ms", file=sys.stderr)
+    return results
+
+# Modules whose import time --startup reports: the app's own and the heavy libraries they use
+STARTUP_MODULES = [
+    'app', 'callbacks', 'layouts', 'compare', 'data_processing', 'simulation', 'store', 'cache', 'jobs', 'metrics',
+    'dash', 'plotly', 'numpy', 'pandas', 'folium', 'diskcache',
+]
+
+# Run in a fresh interpreter: import the app without warming it, then warm it
+STARTUP_SCRIPT = """
+import json, time
+import app
+import data_processing
+start = time.perf_counter()
+data_processing.warm_caches()
+print(json.dumps({'warm_caches': time.perf_counter() - start}))
+"""
+
+# Import time (s) of every module in a fresh interpreter, from python -X importtime. A
+# module's time includes the dependencies it is the first to import, so it depends on the
+# import order. Modules imported on first use (pandas, folium) are counted in warm_caches too.
+def startup_times():
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env={**os.environ, 'WARM_CACHES': '0'},
+        capture_output=True, text=True, check=True,
+    )
+    times = json.loads(output.stdout.splitlines()[-1])
+    for line in output.stderr.splitlines():
+        if line.startswith('import time:') and 'cumulative' not in line:
+            _, cumulative, module = line.split('|')
+            times.setdefault(module.strip(), int(cumulative) / 1e6)
+    return times
+
+# Import time of each module in STARTUP_MODULES and time of warm_caches, best of repeat interpreters
+def benchmark_startup(repeat=5):
+    runs = [startup_times() for _ in range(repeat)]
+    results = []
+    for name in STARTUP_MODULES + ['warm_caches']:
+        times = [run[name] for run in runs if name in run]
+        if not times:
+            continue
+        stage = name if name == 'warm_caches' else f'import {name}'
+        results.append({'route': 'startup', 'stage': stage, 'seconds': min(times), 'runs': times})
+        print(f"{'startup':>20} {stage:>22} {min(times) * 1000:10.1f} ms", file=sys.stderr)
+    return results
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+# Stages slower than in the baseline by more than threshold (a fraction). To tell a
+# regression from timer noise, the best run must also be slower than every baseline run,
+# and stages that take less than min_seconds in both are not compared.
+def regressions(results, baseline, threshold=0.25, min_seconds=0.005):
+    previous = {(row['route'], row['stage']): row for row in baseline['results']}
+    slower = []
+    for row in results['results']:
+        before = previous.get((row['route'], row['stage']))
+        if before is None or max(before['seconds'], row['seconds']) < min_seconds:
+            continue
+        change = row['seconds'] / before['seconds'] - 1 if before['seconds'] > 0 else float('inf')
+        regressed = change > threshold and row['seconds'] > max(before['runs'])
+        print(f"{row['route']:>20} {row['stage']:>10} {before['seconds'] * 1000:10.1f} ms -> {row['seconds'] * 1000:10.1f} ms "
+              f"{change:+8.1%}{'  REGRESSION' if regressed else ''}", file=sys.stderr)
+        if regressed:
+            slower.append({**row, 'baseline_seconds': before['seconds'], 'change': change})
+    return slower
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time every pipeline stage on synthetic and given GPX routes.")
+    parser.add_argument('gpx', nargs='*', help="GPX files to benchmark besides the synthetic routes")
+    parser.add_argument('--sizes', type=int, nargs='*', default=[1000, 10000, 100000, 1000000],
+                        help="Points of the synthetic routes")
+    parser.add_argument('--profiles', nargs='+', choices=list(GRADIENT_PROFILES), default=['rolling'],
+                        help="Gradient profiles of the synthetic routes")
+    parser.add_argument('--spacing', type=float, default=8.0, help="Mean distance between synthetic points (m)")
+    parser.add_argument('--noise', type=float, default=0.0, help="Elevation noise of the synthetic points (m)")
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES), help="Stages to time")
+    parser.add_argument('--startup', action='store_true',
+                        help="Also time the app's imports and warm_caches in fresh interpreters")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per stage, the best one is kept")
+    parser.add_argument('--output', default='benchmark.json', help="JSON file the results are written to")
+    parser.add_argument('--baseline', help="Earlier JSON results to compare with")
+    parser.add_argument('--threshold', type=float, default=0.25, help="Allowed slowdown against the baseline (fraction)")
+    parser.add_argument('--min-seconds', type=float, default=0.005,
+                        help="Stages faster than this in both runs are not compared")
+    args = parser.parse_args(argv)
+
+    routes = []
+    for profile in args.profiles:
+        for size in args.sizes:
+            routes.append((f"{profile}-{size}", lambda size=size, profile=profile: synthetic_gpx(
+                size, spacing=args.spacing, profile=profile, noise=args.noise)))
+    for path in args.gpx:
+        routes.append((os.path.basename(path), lambda path=path: open(path, 'rb').read()))
+
+    results = {'environment': environment(), 'settings': vars(args), 'results': []}
+    # Stages are timed as a started app runs them, with the libraries loaded on first use already loaded
+    warm_caches()
+    for name, source in routes:
+        results['results'].extend(benchmark_route(name, source(), args.stages, args.repeat))
+    if args.startup:
+        results['results'].extend(benchmark_startup(args.repeat))
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=1)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        slower = regressions(results, baseline, args.threshold, args.min_seconds)
+        if slower:
+            print(f"{len(slower)} stage(s) regressed by more than {args.threshold:.0%}", file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
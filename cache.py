@@ -0,0 +1,181 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Default memory budget for cached results (bytes)
+DEFAULT_MAX_BYTES = 256 * 2**20
+
+# Characters of an upload encoded at a time when hashing it
+HASH_CHUNK = 2**20
+
+# Hash of the uploaded file, used to address everything derived from it. A string is
+# hashed a slice at a time rather than encoded whole, which would copy the upload; the
+# digest is the same as that of the whole string's UTF-8 encoding.
+def content_key(contents):
+    if not isinstance(contents, str):
+        return hashlib.sha256(contents).hexdigest()
+    digest = hashlib.sha256()
+    for start in range(0, len(contents), HASH_CHUNK):
+        digest.update(contents[start:start + HASH_CHUNK].encode('utf-8'))
+    return digest.hexdigest()
+
+# Key of the route built from an upload, from the upload's content_key: the same file
+# smoothed differently is a different route
+def route_key(upload_key, smoothing=None, smoothing_window=None):
+    if smoothing is None:
+        return upload_key
+    return content_key(f"{upload_key}:{smoothing}:{smoothing_window}")
+
+# Key of a strategy sweep result: the route and the physics parameters
+def sweep_key(file_key, ftp, bike_mass, rider_mass, C_r, C_d, A, rho):
+    return ('sweep', file_key, ftp, bike_mass, rider_mass, C_r, C_d, A, rho)
+
+# Key of the ride charts of one strategy: the sweep's key and the strategy
+def ride_key(file_key, ftp, bike_mass, rider_mass, C_r, C_d, A, rho, strategy):
+    return ('ride', file_key, ftp, bike_mass, rider_mass, C_r, C_d, A, rho, strategy)
+
+def _key_digest(key):
+    return hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+
+# Remove the least recently modified entries of directory until the ones left fit in
+# max_bytes. size_of(entry) gives the size of a managed os.DirEntry, or None for entries
+# left alone; remove(path) deletes one. Shared by the disk cache and the route store.
+def evict_oldest(directory, max_bytes, size_of, remove):
+    entries = []
+    for entry in os.scandir(directory):
+        try:
+            entry_size = size_of(entry)
+            if entry_size is not None:
+                entries.append((entry.stat().st_mtime, entry_size, entry.path))
+        except OSError:
+            continue
+    size = sum(entry_size for _, entry_size, _ in entries)
+    # Oldest first; another worker may have removed the entry already
+    for _, entry_size, path in sorted(entries):
+        if size <= max_bytes:
+            break
+        try:
+            remove(path)
+        except OSError:
+            pass
+        size -= entry_size
+
+
+class MemoryCache:
+    """
+    In-process LRU cache with a memory budget.
+
+    Values are stored pickled, so every get returns a fresh copy that callers can
+    modify freely, and entry sizes are known exactly for the budget.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is None:
+                return None
+            self._entries.move_to_end(key)
+        return pickle.loads(payload)
+
+    def set(self, key, value):
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = payload
+            self.size += len(payload)
+            # Evict least recently used entries until back under budget
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class DiskCache:
+    """
+    On-disk LRU cache with a size budget, shared by every process using the same directory.
+
+    Each entry is a pickle file written atomically; reads refresh the file's
+    modification time, which drives least-recently-used eviction.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, _key_digest(key) + '.pkl')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return value
+
+    def set(self, key, value):
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.max_bytes:
+            return
+        # A failed write only means a cache miss later, never a failed request
+        tmp_path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._evict()
+
+    def _evict(self):
+        evict_oldest(self.directory, self.max_bytes, self._entry_size, os.remove)
+
+    def _entry_size(self, entry):
+        return entry.stat().st_size if entry.name.endswith('.pkl') else None
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.pkl'):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+
+# Build the cache configured through the environment:
+# ROUTE_CACHE_BACKEND ('disk' or 'memory'), ROUTE_CACHE_DIR and ROUTE_CACHE_MAX_BYTES.
+# Callbacks run as background jobs in their own processes, so the app needs the disk backend;
+# the memory backend is meant for single-process use of the library.
+def create_cache():
+    backend = os.environ.get('ROUTE_CACHE_BACKEND', 'disk')
+    max_bytes = int(os.environ.get('ROUTE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+    if backend == 'memory':
+        return MemoryCache(max_bytes)
+    if backend == 'disk':
+        directory = os.environ.get('ROUTE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'gpx-visualizer-cache'))
+        return DiskCache(directory, max_bytes)
+    raise ValueError(f"Unknown cache backend '{backend}'")
@@ -1,14 +1,180 @@
-from dash import html, Input, Output, State, dcc
+import os
+from dash import html, Input, Output, State, dcc, ctx, no_update
 from data_processing import parse_gpx, build_dataframe
 import dash_bootstrap_components as dbc
-from data_processing import visualize_data, visualize_map, update_speed_pacing
+from data_processing import visualize_data, visualize_map, simulate_sweep, visualize_ride
 import numpy as np
+from cache import create_cache, content_key, route_key, sweep_key, ride_key
+from layouts import STRATEGY_LABELS
+from jobs import create_job_manager, create_upload_spool, progress_reporter, UPLOAD_EXPIRE
+from store import create_route_store
+from metrics import stage, profiled
+from compare import summarise_uploads, comparison_view
 
-# Callback to handle file upload and display data
+# Callbacks to handle file upload, display data and simulate the ride.
+# The upload alone drives parsing, profile and map; the physics inputs and the strategy
+# only drive the simulation. Route data stays on the server, in the cache, and the
+# browser only holds its key in the 'route-key' store. Processed routes are kept in the
+# route store, from which they can be reopened without uploading them again.
+# Uploads are received by plain callbacks that keep them in the upload spool; the
+# background jobs, which report progress and can be cancelled, only get their keys.
+
+# Comparison of the estimated time and energy of every strategy
+def strategy_table(results, selected_strategy):
+    header = html.Thead(html.Tr([html.Th("Strategy"), html.Th("Estimated time"), html.Th("Energy (kJ)")]))
+    rows = [
+        html.Tr(
+            [
+                html.Td(STRATEGY_LABELS.get(row['strategy'], row['strategy'])),
+                html.Td(row['estimated_time']),
+                html.Td(row['energy_kj']),
+            ],
+            className="table-active" if row['strategy'] == selected_strategy else None,
+        )
+        for _, row in results.iterrows()
+    ]
+    return dbc.Table([header, html.Tbody(rows)], color="dark", bordered=True, hover=True, size="sm")
+
+def register_callbacks(app, cache=None, manager=None, store=None, spool=None):
+    if cache is None:
+        cache = create_cache()
+    if store is None:
+        store = create_route_store()
+    if manager is None:
+        manager = create_job_manager()
+    if spool is None:
+        spool = create_upload_spool()
+    # Optional elevation smoothing applied to every upload, see data_processing.SMOOTHING_METHODS
+    smoothing = os.environ.get('ROUTE_SMOOTHING') or None
+    smoothing_window = float(os.environ['ROUTE_SMOOTHING_WINDOW']) if os.environ.get('ROUTE_SMOOTHING_WINDOW') else None
+
+    # Hash an upload and keep it for a background job, unless its route is already stored
+    def spool_upload(contents):
+        upload_key = content_key(contents)
+        if route_key(upload_key, smoothing, smoothing_window) not in store:
+            spool.set(upload_key, contents, expire=UPLOAD_EXPIRE)
+        return upload_key
+
+    # Parse a spooled upload, unless the same file is already in the route store
+    def load_upload(upload_key, filename, progress=None):
+        file_key = route_key(upload_key, smoothing, smoothing_window)
+        data = open_route(file_key)
+        if data is None:
+            contents = spool.get(upload_key)
+            if contents is None:
+                raise ValueError("The upload has expired, please upload the GPX file again")
+            if progress is not None:
+                progress((10, "Parsing GPX file..."))
+            with stage('parse_gpx', route=file_key) as counts:
+                points = parse_gpx(contents)
+                counts['points'] = len(points[0])
+            with stage('build_dataframe', route=file_key) as counts:
+                data = build_dataframe(points, smoothing=smoothing, smoothing_window=smoothing_window)
+                counts['points'] = len(data)
+                counts['segments'] = max(len(data) - 1, 0)
+            store.save(file_key, data, filename)
+        return file_key, data
+
+    # Load a route from the route store, None when it is not there
+    def open_route(file_key):
+        with stage('store_load', route=file_key) as counts:
+            data = store.load(file_key)
+            counts['points'] = 0 if data is None else len(data)
+        return data
+
+    # Render the profile and map of a route, reusing cached results for the same route
+    def render_route(file_key, data, progress=None):
+        def report(done, label):
+            if progress is not None:
+                progress((done, f"{label}..."))
+
+        fig_profile = cache.get(('profile', file_key))
+        if fig_profile is None:
+            report(40, "Drawing profile")
+            with stage('visualize_data', route=file_key) as counts:
+                fig_profile = visualize_data(data).to_dict()
+                counts['points'] = len(data)
+            cache.set(('profile', file_key), fig_profile)
+        fig_map = cache.get(('map', file_key))
+        if fig_map is None:
+            report(70, "Drawing map")
+            with stage('visualize_map', route=file_key) as counts:
+                fig_map = visualize_map(data, icon_url=app.get_asset_url('images/'))
+                counts['points'] = len(data)
+            cache.set(('map', file_key), fig_map)
+        return fig_profile, fig_map
+
+    # The upload itself is only sent once, to this callback
+    @app.callback(
+        Output('upload-key', 'data'),
+        Input('upload-gpx', 'contents'),
+        State('upload-gpx', 'filename'),
+        prevent_initial_call=True,
+    )
+    def receive_upload(contents, filename):
+        if contents is None:
+            return no_update
+        return {'key': spool_upload(contents), 'filename': filename}
 
-def register_callbacks(app):
     @app.callback(
-        Output('output-data-upload', 'children'),
+        [
+            Output('route-key', 'data'),
+            Output('route-display', 'children'),
+        ],
+        Input('upload-key', 'data'),
+        Input('saved-routes', 'value'),
+        background=True,
+        manager=manager,
+        interval=250,
+        prevent_initial_call=True,
+        progress=[Output('route-progress', 'value'), Output('route-progress', 'label')],
+        progress_default=[0, ""],
+        running=[
+            (Output('route-progress-row', 'style'), {"display": "flex"}, {"display": "none"}),
+            (Output('cancel-route', 'disabled'), False, True),
+        ],
+        cancel=[Input('cancel-route', 'n_clicks')],
+    )
+    def parse_and_display_gpx(set_progress, upload, saved_route):
+        # Default message if no file is uploaded
+        if upload is None and saved_route is None:
+            return None, html.Div(
+                "Upload a GPX file to see its data.",
+                className="text-center mt-4",
+                style={"color": "white"},
+            )
+
+        try:
+            with profiled('route'):
+                # Clearing the saved route goes back to the uploaded file
+                if saved_route is not None and (ctx.triggered_id == 'saved-routes' or upload is None):
+                    # Reopen a stored route, memory-mapped
+                    file_key = saved_route
+                    data = open_route(file_key)
+                    if data is None:
+                        return None, "This route is no longer saved, please upload the GPX file again."
+                else:
+                    # Parse the GPX file and build the DataFrame (stored per file)
+                    file_key, data = load_upload(upload['key'], upload['filename'], set_progress)
+                fig_profile, fig_map = render_route(file_key, data, set_progress)
+        except ValueError as e:
+            return None, f"An error occurred: {str(e)}"
+
+        return file_key, [
+            dbc.Row(
+                dbc.Col(dcc.Graph(figure=fig_profile), width=12),  # Full width for all data graph
+            ),
+            html.H4(
+                f"Map",
+                style={"textAlign": "center", "marginTop": "15px", "color":"white"},
+            ),
+            dbc.Row(
+                dbc.Col(html.Div(html.Iframe(srcDoc=fig_map,height="500px",width="100%")), width=12),  # Full width for all data graph
+            ),
+        ]
+
+    @app.callback(
+        Output('ride-summary', 'children'),
         [
             Input("ftp-input", "value"),
             Input("bike-mass", "value"),
@@ -18,55 +184,171 @@ def register_callbacks(app):
             Input("frontal-area", "value"),
             Input("air-density", "value"),
             Input("strategy-selector", "value"),
-            Input('upload-gpx', 'contents'),
+            Input('route-key', 'data'),
         ],
-        [State('upload-gpx', 'filename')]
+        background=True,
+        manager=manager,
+        interval=250,
+        prevent_initial_call=True,
+        progress=[Output('simulation-progress', 'value'), Output('simulation-progress', 'label')],
+        progress_default=[0, ""],
+        running=[
+            (Output('simulation-progress-row', 'style'), {"display": "flex"}, {"display": "none"}),
+            (Output('cancel-simulation', 'disabled'), False, True),
+        ],
+        cancel=[Input('cancel-simulation', 'n_clicks')],
     )
-    def parse_and_display_gpx(ftp, bike_mass, rider_mass, C_r, C_d, A, rho, strategy, contents, filename):
+    def simulate_ride(set_progress, ftp, bike_mass, rider_mass, C_r, C_d, A, rho, strategy, file_key):
         if ftp is None or strategy is None:
             return html.Div(
                 "Please provide FTP and select a strategy.",
                 className="text-center mt-4"
                 )
-        
-        if contents is not None:
-            try:
-                # Step 1: Parse the GPX file
-                points = parse_gpx(contents)
 
-                # Step 2: Build the DataFrame
-                data = build_dataframe(points)
-                fig_profile = visualize_data(data)
-                fig_map = visualize_map(data)
-                estimated_time, energy_consumption, elevation_gain = update_speed_pacing(data,ftp,bike_mass,rider_mass,C_r,C_d,A,rho,strategy)
-                total_distance = np.round(data['Cumulative Distance (m)'].tail(1).values[0] / 1000, 1)
-                
-                # Step 3: Visualize the data
-                return html.Div(
-                    [
-                        html.H2(
-                            f"The {total_distance} km ride, featuring a {elevation_gain} m elevation gain, will take approximately {estimated_time} and require an energy expenditure of {energy_consumption} kJ.",
-                            style={"textAlign": "center", "marginTop": "15px", "color": "white"},
-                        ),
-                        dbc.Row(
-                            dbc.Col(dcc.Graph(figure=fig_profile), width=12),  # Full width for all data graph
-                        ),
-                        html.H4(
-                            f"Map",
-                            style={"textAlign": "center", "marginTop": "15px", "color":"white"},
-                        ),
-                        dbc.Row(
-                            dbc.Col(html.Div(html.Iframe(srcDoc=fig_map,height="500px",width="100%")), width=12),  # Full width for all data graph
-                        ),
-                    ]
-                )
+        if file_key is None:
+            return None
 
-            except ValueError as e:
-                return f"An error occurred: {str(e)}"
+        data = open_route(file_key)
+        if data is None:
+            return html.Div(
+                "The route is no longer available, please upload the GPX file again.",
+                className="text-center mt-4",
+                style={"color": "white"},
+            )
 
-        # Default message if no file is uploaded
-        return html.Div(
-            "Upload a GPX file to see its data.",
-            className="text-center mt-4",
-            style={"color": "white"},
-        )
+        try:
+            # Simulate every strategy at once (cached per file and parameters) and draw the
+            # charts of each from its per-point results, so switching strategy and comparing
+            # them needs no new simulation
+            result_key = sweep_key(file_key, ftp, bike_mass, rider_mass, C_r, C_d, A, rho)
+            charts_key = ride_key(file_key, ftp, bike_mass, rider_mass, C_r, C_d, A, rho, strategy)
+            results = cache.get(result_key)
+            charts = cache.get(charts_key)
+            if results is None or charts is None:
+                progress = progress_reporter(set_progress, "Simulating rides")
+                configs = [
+                    dict(ftp=ftp, bike_mass=bike_mass, rider_mass=rider_mass, C_r=C_r, C_d=C_d, A=A, rho=rho, strategy=name)
+                    for name in STRATEGY_LABELS
+                ]
+                with profiled('simulation'), stage('simulate_sweep', route=file_key) as counts:
+                    results, series = simulate_sweep(data, configs, progress, series=True)
+                    counts['points'] = len(data)
+                    counts['segments'] = results['segments'].sum()
+                    counts['steps'] = results['integration_steps'].sum()
+                with stage('visualize_ride', route=file_key) as counts:
+                    for config, ride in zip(configs, series):
+                        strategy_charts = visualize_ride(data, ride)
+                        cache.set(ride_key(file_key, ftp, bike_mass, rider_mass, C_r, C_d, A, rho, config['strategy']), strategy_charts)
+                        if config['strategy'] == strategy:
+                            charts = strategy_charts
+                    counts['points'] = len(data) * len(configs)
+                cache.set(result_key, results)
+        except ValueError as e:
+            return f"An error occurred: {str(e)}"
+        speed_chart, power_chart, splits_chart = charts
+
+        selected = results[results['strategy'] == strategy].iloc[0]
+        total_distance = np.round(data['Cumulative Distance (m)'].tail(1).values[0] / 1000, 1)
+
+        return [
+            html.H2(
+                f"The {total_distance} km ride, featuring a {selected['elevation_gain_m']} m elevation gain, will take approximately {selected['estimated_time']} and require an energy expenditure of {selected['energy_kj']} kJ.",
+                style={"textAlign": "center", "marginTop": "15px", "color": "white"},
+            ),
+            dbc.Row(
+                dbc.Col(strategy_table(results, strategy), width={"size": 8, "offset": 2}),
+                className="mt-3",
+            ),
+            dbc.Row(dbc.Col(dcc.Graph(figure=speed_chart), width=12), className="mt-3"),
+            dbc.Row(dbc.Col(dcc.Graph(figure=power_chart), width=12)),
+            dbc.Row(dbc.Col(dcc.Graph(figure=splits_chart), width=12)),
+        ]
+
+    # The files to compare are only sent once, to this callback
+    @app.callback(
+        Output('compare-uploads', 'data'),
+        Input('compare-gpx', 'contents'),
+        State('compare-gpx', 'filename'),
+        prevent_initial_call=True,
+    )
+    def receive_comparison(contents, filenames):
+        if not contents:
+            return no_update
+        return [[spool_upload(upload), filename] for upload, filename in zip(contents, filenames)]
+
+    @app.callback(
+        Output('route-comparison', 'children'),
+        Input('compare-uploads', 'data'),
+        [
+            State("ftp-input", "value"),
+            State("bike-mass", "value"),
+            State("rider-mass", "value"),
+            State("rolling-coeff", "value"),
+            State("drag-coeff", "value"),
+            State("frontal-area", "value"),
+            State("air-density", "value"),
+            State("strategy-selector", "value"),
+        ],
+        background=True,
+        manager=manager,
+        interval=1000,
+        prevent_initial_call=True,
+        progress=[
+            Output('compare-progress', 'value'),
+            Output('compare-progress', 'label'),
+            Output('route-comparison', 'children'),
+        ],
+        progress_default=[0, "", None],
+        running=[
+            (Output('compare-progress-row', 'style'), {"display": "flex"}, {"display": "none"}),
+            (Output('cancel-compare', 'disabled'), False, True),
+        ],
+        cancel=[Input('cancel-compare', 'n_clicks')],
+    )
+    def compare_routes(set_progress, compared, ftp, bike_mass, rider_mass, C_r, C_d, A, rho, strategy):
+        if not compared:
+            return None
+        if ftp is None or strategy is None:
+            return html.Div("Please provide FTP and select a strategy.", className="text-center mt-4")
+
+        # Routes are parsed and simulated in a worker pool, and the comparison grows as
+        # each one finishes
+        config = dict(ftp=ftp, bike_mass=bike_mass, rider_mass=rider_mass, C_r=C_r, C_d=C_d, A=A, rho=rho, strategy=strategy)
+        summaries = [None] * len(compared)
+        done = 0
+        with stage('compare_routes') as counts:
+            for index, summary in summarise_uploads(
+                compared, config,
+                spool=spool, store=store, smoothing=smoothing, smoothing_window=smoothing_window,
+            ):
+                summaries[index] = summary
+                done += 1
+                view = comparison_view([summary for summary in summaries if summary is not None])
+                percent = int(100 * done / len(compared))
+                set_progress((percent, f"Compared {done} of {len(compared)} routes", view))
+            counts['points'] = sum(summary.get('points', 0) for summary in summaries)
+        return comparison_view(summaries)
+
+    # Remember the routes opened in this browser, dropping those no longer stored
+    @app.callback(
+        Output('saved-route-keys', 'data'),
+        Input('route-key', 'data'),
+        State('saved-route-keys', 'data'),
+        prevent_initial_call=True,
+    )
+    def remember_route(file_key, keys):
+        keys = [key for key in keys or [] if isinstance(key, str)]
+        if file_key is None or file_key in keys:
+            return no_update
+        return [file_key] + [key for key in keys if store.describe(key) is not None]
+
+    # Saved routes of this browser only, other visitors' routes are never listed
+    @app.callback(
+        Output('saved-routes', 'options'),
+        Input('saved-route-keys', 'data'),
+    )
+    def list_saved_routes(keys):
+        return [
+            {'label': f"{route['name']} ({route['distance_km']} km)", 'value': route['key']}
+            for route in store.list([key for key in keys or [] if isinstance(key, str)])
+        ]
@@ -0,0 +1,133 @@
+import itertools
+import os
+from concurrent.futures import Future, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from dash import html, dcc
+import dash_bootstrap_components as dbc
+import plotly.graph_objects as go
+
+from cache import route_key
+from data_processing import parse_gpx, build_dataframe, simulate_sweep, downsample_lttb
+
+# Points of each route drawn on the overlaid profiles
+COMPARISON_PROFILE_POINTS = 500
+
+# Parse, simulate and summarise one uploaded route. Runs in a worker process and only
+# returns the summary and a downsampled profile, never the route itself.
+# The route is read from the route store when it is already there, and kept in it
+# otherwise; only then is the upload read from the upload spool.
+def summarise_upload(upload_key, filename, config, spool, store=None, smoothing=None, smoothing_window=None):
+    try:
+        file_key = route_key(upload_key, smoothing, smoothing_window)
+        data = store.load(file_key) if store is not None else None
+        if data is None:
+            contents = spool.get(upload_key)
+            if contents is None:
+                raise ValueError("The upload has expired, please upload the file again")
+            data = build_dataframe(parse_gpx(contents), smoothing=smoothing, smoothing_window=smoothing_window)
+            if store is not None:
+                store.save(file_key, data, filename)
+        result = simulate_sweep(data, [config]).iloc[0]
+    except ValueError as e:
+        return {'name': filename, 'error': str(e)}
+
+    distance = data['Cumulative Distance (m)'].to_numpy()
+    elevation = data['Elevation (m)'].to_numpy()
+    plotted = downsample_lttb(distance, elevation, COMPARISON_PROFILE_POINTS)
+    return {
+        'name': filename,
+        'key': file_key,
+        'points': len(data),
+        'distance_km': round(float(distance[-1]) / 1000, 1),
+        'elevation_gain_m': int(result['elevation_gain_m']),
+        'time_s': float(result['time_s']),
+        'estimated_time': result['estimated_time'],
+        'energy_kj': int(result['energy_kj']),
+        'profile': ((distance[plotted] / 1000).tolist(), elevation[plotted].tolist()),
+    }
+
+def summarise_uploads(uploads, config, workers=None, **options):
+    """
+    Summarise several uploads in a process pool, yielding (index, summary) as each finishes.
+
+    Routes go through the pool as a pipeline: at most `workers` of them are in flight,
+    so no more than that many files are decoded and simulated at any time, whatever the
+    number of uploads. Each task only carries the upload's key; the worker reads the file
+    from the upload spool itself.
+
+    Args:
+    uploads: (upload key, filename) pairs of spooled uploads
+    config: rider configuration, as in simulate_sweep
+    workers: worker processes (default: one per CPU, at most one per upload)
+    options: spool (the upload spool), store, smoothing and smoothing_window, passed to summarise_upload
+
+    A route that fails, for any reason, is summarised as {'name': filename, 'error': message}.
+    """
+    uploads = list(uploads)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(uploads)))
+    queue = iter(enumerate(uploads))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        def submit(index, upload):
+            upload_key, filename = upload
+            try:
+                future = executor.submit(summarise_upload, upload_key, filename, config, **options)
+            except BrokenProcessPool as e:
+                # A worker died: the remaining routes fail like the ones it was running
+                future = Future()
+                future.set_exception(e)
+            return future, index
+
+        pending = dict(submit(index, upload) for index, upload in itertools.islice(queue, workers))
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    # Whatever goes wrong with one route only fails its own row
+                    summary = {'name': uploads[index][1], 'error': str(e) or type(e).__name__}
+                yield index, summary
+                following = next(queue, None)
+                if following is not None:
+                    future, following_index = submit(*following)
+                    pending[future] = following_index
+
+# Table and overlaid profiles of the summarised routes, in upload order
+def comparison_view(summaries):
+    header = html.Thead(html.Tr([
+        html.Th("Route"), html.Th("Distance (km)"), html.Th("Elevation gain (m)"),
+        html.Th("Estimated time"), html.Th("Energy (kJ)"),
+    ]))
+    rows = []
+    figure = go.Figure()
+    for summary in summaries:
+        if 'error' in summary:
+            rows.append(html.Tr([html.Td(summary['name']), html.Td(f"An error occurred: {summary['error']}", colSpan=4)]))
+            continue
+        rows.append(html.Tr([
+            html.Td(summary['name']),
+            html.Td(summary['distance_km']),
+            html.Td(summary['elevation_gain_m']),
+            html.Td(summary['estimated_time']),
+            html.Td(summary['energy_kj']),
+        ]))
+        distance, elevation = summary['profile']
+        figure.add_trace(go.Scatter(x=distance, y=elevation, mode='lines', name=summary['name']))
+    figure.update_layout(
+        title=dict(text='Route Profiles', font_size=24, y=0.95, x=0.5, xanchor='center', yanchor='top'),
+        xaxis=dict(title='Distance (km)', title_font_size=18, title_standoff=10),
+        yaxis=dict(title='Altitude (m)', title_font_size=18, title_standoff=10),
+    )
+    return [
+        html.H4("Route comparison", style={"textAlign": "center", "marginTop": "15px", "color": "white"}),
+        dbc.Row(
+            dbc.Col(
+                dbc.Table([header, html.Tbody(rows)], color="dark", bordered=True, hover=True, size="sm"),
+                width={"size": 10, "offset": 1},
+            ),
+            className="mt-3",
+        ),
+        dbc.Row(dbc.Col(dcc.Graph(figure=figure), width=12)),
+    ]
@@ -0,0 +1,29 @@
+import os
+import tempfile
+import diskcache
+from dash import DiskcacheManager
+
+# Background callback manager: long callbacks run in their own process instead of
+# blocking the gunicorn worker, and report progress through a disk cache shared by
+# all workers. The directory is set with JOB_CACHE_DIR.
+def job_cache_directory():
+    return os.environ.get('JOB_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'gpx-visualizer-jobs'))
+
+def create_job_manager():
+    return DiskcacheManager(diskcache.Cache(job_cache_directory()))
+
+# Seconds an upload is kept for its background job
+UPLOAD_EXPIRE = 3600
+
+# Uploads waiting for their background job. Background callbacks send all their inputs
+# again with every progress poll, so uploads are received once by a plain callback that
+# keeps them here, and the jobs only get their keys.
+def create_upload_spool():
+    return diskcache.Cache(os.path.join(job_cache_directory(), 'uploads'))
+
+# Wrap a Dash set_progress function into a (done, total) progress function for a progress bar
+def progress_reporter(set_progress, label):
+    def report(done, total):
+        percent = int(100 * done / total) if total else 100
+        set_progress((percent, f"{label} {percent}%"))
+    return report
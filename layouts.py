@@ -1,6 +1,14 @@
 from dash import dcc, html
 import dash_bootstrap_components as dbc
 
+# Riding strategies offered in the app, by pacing strategy name
+STRATEGY_LABELS = {
+    "zone1": "Recovery Ride (Zone 1)",
+    "zone2": "Endurance Ride (Zone 2)",
+    "zone3": "Tempo Ride (Zone 3)",
+    "push_hard": "Push Hard Ride",
+}
+
 layout = dbc.Container(
     [
         dbc.Row(
@@ -72,12 +80,7 @@ layout = dbc.Container(
                 html.Label("SELECT A RIDING STRATEGY", style={"color": "white", "fontWeight": "bold", "padding": "5px", "margin-top": "15px"}),
                 dbc.RadioItems(
                     id="strategy-selector",
-                    options=[
-                        {"label": "Recovery Ride (Zone 1)", "value": "zone1"},
-                        {"label": "Endurance Ride (Zone 2)", "value": "zone2",},
-                        {"label": "Tempo Ride (Zone 3)", "value": "zone3"},
-                        {"label": "Push Hard Ride", "value": "push_hard"},
-                    ],
+                    options=[{"label": label, "value": value} for value, label in STRATEGY_LABELS.items()],
                     className="btn-group",
                     inputClassName="btn-check",
                     labelClassName="btn btn-outline-light",
@@ -111,23 +114,99 @@ layout = dbc.Container(
                         'margin': 'auto'
                     },
                     multiple=False,
-                    accept=".gpx"
+                    accept=".gpx,.gz"
+                ),
+                width={"size": 6, "offset": 3}
+            )
+        ),
+        # Routes processed before, reopened without uploading them again
+        dbc.Row(
+            dbc.Col(
+                dcc.Dropdown(id="saved-routes", placeholder="Or open a saved route", className="mt-3"),
+                width={"size": 6, "offset": 3}
+            )
+        ),
+        # Several routes at once, compared with the current rider settings and strategy
+        dbc.Row(
+            dbc.Col(
+                dcc.Upload(
+                    id='compare-gpx',
+                    children=dbc.Button("Compare GPX Files", color="secondary", outline=True, className="mt-3"),
+                    style={'width': '100%', 'textAlign': 'center', 'margin': 'auto'},
+                    multiple=True,
+                    accept=".gpx,.gz"
                 ),
                 width={"size": 6, "offset": 3}
             )
         ),
-        
+
+        # Progress of the background jobs, shown while they run
+        dbc.Row(
+            [
+                dbc.Col(dbc.Progress(id="route-progress", value=0, striped=True, animated=True), width=5),
+                dbc.Col(dbc.Button("Cancel", id="cancel-route", color="light", outline=True, size="sm", disabled=True), width="auto"),
+            ],
+            id="route-progress-row",
+            justify="center",
+            align="center",
+            className="mt-3",
+            style={"display": "none"},
+        ),
+        dbc.Row(
+            [
+                dbc.Col(dbc.Progress(id="simulation-progress", value=0, color="success", striped=True, animated=True), width=5),
+                dbc.Col(dbc.Button("Cancel", id="cancel-simulation", color="light", outline=True, size="sm", disabled=True), width="auto"),
+            ],
+            id="simulation-progress-row",
+            justify="center",
+            align="center",
+            className="mt-3",
+            style={"display": "none"},
+        ),
+        dbc.Row(
+            [
+                dbc.Col(dbc.Progress(id="compare-progress", value=0, color="info", striped=True, animated=True), width=5),
+                dbc.Col(dbc.Button("Cancel", id="cancel-compare", color="light", outline=True, size="sm", disabled=True), width="auto"),
+            ],
+            id="compare-progress-row",
+            justify="center",
+            align="center",
+            className="mt-3",
+            style={"display": "none"},
+        ),
         dbc.Row(
             dbc.Col(
                 dcc.Loading(
                             id="loading",
                             type="dot",  # Choose spinner type: "circle", "dot", or "default"
                             style={"marginTop": "30px"},
-                            children=dbc.Container(id="output-data-upload", fluid=True),
+                            children=dbc.Container(
+                                [
+                                    html.Div(id="ride-summary"),
+                                    html.Div(
+                                        html.Div(
+                                            "Upload a GPX file to see its data.",
+                                            className="text-center mt-4",
+                                            style={"color": "white"},
+                                        ),
+                                        id="route-display",
+                                    ),
+                                    html.Div(id="route-comparison"),
+                                ],
+                                id="output-data-upload",
+                                fluid=True,
+                            ),
                         ),
                 width=12
             )
-        )
+        ),
+        # Key of the uploaded route, its data is kept on the server
+        dcc.Store(id="route-key"),
+        # Keys of the routes opened in this browser, the only ones listed as saved routes
+        dcc.Store(id="saved-route-keys", storage_type="local"),
+        # Keys of the spooled uploads handed to the background jobs
+        dcc.Store(id="upload-key"),
+        dcc.Store(id="compare-uploads"),
     ],
     fluid=True,
     className="p-4",
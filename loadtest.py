@@ -0,0 +1,161 @@
+"""
+Load test of a running app: concurrent clients uploading GPX files the way the page does.
+
+    gunicorn app:server -b 127.0.0.1:8000 -w 2
+    python loadtest.py http://127.0.0.1:8000 route.gpx --clients 1 2 4 6 --uploads 3
+
+Each client sends the upload once to the receiving callback, starts the route job with
+the upload's key and polls it until it finishes, as dash-renderer does. Every upload
+gets a unique trailing comment, so none is served from the cache or the route store.
+Meanwhile a probe requests the page layout every --probe-interval seconds, to show how
+responsive the workers stay. For each number of clients the throughput, the upload and
+layout latencies and the bytes sent are reported, and written as JSON with --output.
+"""
+import argparse
+import base64
+import json
+import sys
+import threading
+import time
+import urllib.request
+
+ROUTE_OUTPUT = "..route-key.data...route-display.children.."
+
+class Client:
+    def __init__(self, url, poll_interval=0.25):
+        self.url = url.rstrip('/')
+        self.poll_interval = poll_interval
+        self.sent = 0
+
+    def post(self, body, query=''):
+        data = json.dumps(body).encode()
+        self.sent += len(data)
+        request = urllib.request.Request(
+            self.url + '/_dash-update-component' + query, data=data, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=600) as response:
+            return json.loads(response.read() or b'{}')
+
+    # Upload a file and wait for its route to be displayed
+    def upload(self, contents, filename):
+        received = self.post({
+            "output": "upload-key.data",
+            "outputs": {"id": "upload-key", "property": "data"},
+            "inputs": [{"id": "upload-gpx", "property": "contents", "value": contents}],
+            "state": [{"id": "upload-gpx", "property": "filename", "value": filename}],
+            "changedPropIds": ["upload-gpx.contents"],
+        })
+        upload = received['response']['upload-key']['data']
+        body = {
+            "output": ROUTE_OUTPUT,
+            "outputs": [{"id": "route-key", "property": "data"}, {"id": "route-display", "property": "children"}],
+            "inputs": [
+                {"id": "upload-key", "property": "data", "value": upload},
+                {"id": "saved-routes", "property": "value", "value": None},
+            ],
+            "changedPropIds": ["upload-key.data"],
+        }
+        job = self.post(body)
+        query = ''
+        while 'response' not in job:
+            if 'cacheKey' in job:
+                query = f"?cacheKey={job['cacheKey']}&job={job['job']}"
+            time.sleep(self.poll_interval)
+            job = self.post(body, query)
+        return job['response']
+
+def upload_contents(gpx_bytes, tag):
+    gpx_bytes += f"\n<!-- loadtest {tag} -->\n".encode()
+    return 'data:application/gpx+xml;base64,' + base64.b64encode(gpx_bytes).decode('ascii')
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+# Request the page layout every interval seconds until stopped, recording each latency
+def probe(url, interval, stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url.rstrip('/') + '/_dash-layout', timeout=60) as response:
+                response.read()
+            latencies.append(time.perf_counter() - start)
+        except OSError:
+            pass
+        stop.wait(interval)
+
+# Run clients concurrent clients, each uploading the files uploads times in turn
+def run(url, files, clients, uploads, probe_interval=0.2, poll_interval=0.25):
+    upload_latencies, layout_latencies, errors = [], [], []
+    workers = [Client(url, poll_interval) for _ in range(clients)]
+
+    def work(index, client):
+        for n in range(uploads):
+            name, gpx_bytes = files[(index + n) % len(files)]
+            contents = upload_contents(gpx_bytes, f"{index}-{n}-{time.time()}")
+            start = time.perf_counter()
+            try:
+                client.upload(contents, name)
+                upload_latencies.append(time.perf_counter() - start)
+            except (OSError, KeyError, ValueError) as e:
+                errors.append(str(e))
+
+    stop = threading.Event()
+    prober = threading.Thread(target=probe, args=(url, probe_interval, stop, layout_latencies))
+    threads = [threading.Thread(target=work, args=(index, client)) for index, client in enumerate(workers)]
+    start = time.perf_counter()
+    prober.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    prober.join()
+
+    return {
+        'clients': clients,
+        'uploads': len(upload_latencies),
+        'errors': errors,
+        'seconds': elapsed,
+        'uploads_per_minute': 60 * len(upload_latencies) / elapsed,
+        'upload_median_s': percentile(upload_latencies, 0.5),
+        'upload_p95_s': percentile(upload_latencies, 0.95),
+        'layout_median_s': percentile(layout_latencies, 0.5),
+        'layout_p95_s': percentile(layout_latencies, 0.95),
+        'sent_mb': sum(client.sent for client in workers) / 2**20,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent GPX uploads against a running app.")
+    parser.add_argument('url', help="Base URL of the app")
+    parser.add_argument('gpx', nargs='+', help="GPX files to upload, in turn")
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 2, 4, 6], help="Numbers of concurrent clients to test")
+    parser.add_argument('--uploads', type=int, default=3, help="Uploads per client")
+    parser.add_argument('--probe-interval', type=float, default=0.2, help="Seconds between layout requests")
+    parser.add_argument('--poll-interval', type=float, default=0.25, help="Seconds between job polls")
+    parser.add_argument('--output', help="JSON file the results are written to")
+    args = parser.parse_args(argv)
+
+    files = []
+    for path in args.gpx:
+        with open(path, 'rb') as f:
+            files.append((path.rsplit('/', 1)[-1], f.read()))
+
+    results = []
+    print(f"{'clients':>7} {'uploads/min':>11} {'upload p50':>10} {'upload p95':>10} "
+          f"{'layout p50':>10} {'layout p95':>10} {'sent MB':>8} {'errors':>6}", file=sys.stderr)
+    for clients in args.clients:
+        row = run(args.url, files, clients, args.uploads, args.probe_interval, args.poll_interval)
+        results.append(row)
+        print(f"{clients:>7} {row['uploads_per_minute']:>11.1f} {row['upload_median_s'] or 0:>9.2f}s "
+              f"{row['upload_p95_s'] or 0:>9.2f}s {row['layout_median_s'] or 0:>9.3f}s "
+              f"{row['layout_p95_s'] or 0:>9.3f}s {row['sent_mb']:>8.1f} {len(row['errors']):>6}", file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    return 1 if any(row['errors'] for row in results) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
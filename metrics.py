@@ -0,0 +1,163 @@
+import cProfile
+import json
+import logging
+import os
+import resource
+import tempfile
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+import diskcache
+from flask import Response
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (s) of the stage duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Stages run in background job processes while /metrics is served by the web workers,
+# so the aggregates live in a disk cache shared by all of them. The directory is set
+# with METRICS_DIR.
+@lru_cache(maxsize=None)
+def metrics_store():
+    directory = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'gpx-visualizer-metrics'))
+    return diskcache.Cache(directory)
+
+# Reset the peak resident memory of this process to its current size (Linux only)
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+# Peak resident memory (bytes) since the last reset, or since the process started
+# where it cannot be reset
+def peak_rss():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+# Add one stage run to the shared aggregates
+def record_stage(name, seconds, points=0, segments=0, steps=0, rss=0, failed=False):
+    store = metrics_store()
+    with store.transact():
+        stats = store.get(('stage', name)) or {
+            'count': 0, 'errors': 0, 'seconds': 0.0, 'buckets': [0] * len(DURATION_BUCKETS),
+            'points': 0, 'segments': 0, 'steps': 0, 'peak_rss': 0,
+        }
+        stats['count'] += 1
+        stats['errors'] += int(failed)
+        stats['seconds'] += seconds
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                stats['buckets'][i] += 1
+        stats['points'] += points
+        stats['segments'] += segments
+        stats['steps'] += steps
+        stats['peak_rss'] = max(stats['peak_rss'], rss)
+        store.set(('stage', name), stats)
+
+@contextmanager
+def stage(name, **fields):
+    """
+    Time one pipeline stage, record it in the shared metrics and log it as one JSON line.
+
+    Yields a dict the stage fills in with what it processed: points, segments and
+    integration steps. Extra keyword arguments (e.g. the route key) only go to the log.
+    Stages are not meant to be nested, as each one resets the peak memory measurement.
+    """
+    counts = {'points': 0, 'segments': 0, 'steps': 0}
+    reset_peak_rss()
+    start = time.perf_counter()
+    failed = True
+    try:
+        yield counts
+        failed = False
+    finally:
+        seconds = time.perf_counter() - start
+        rss = peak_rss()
+        counts = {key: int(value) for key, value in counts.items()}
+        # Metrics are best effort: a locked or full metrics store must not replace the stage's outcome
+        try:
+            record_stage(name, seconds, rss=rss, failed=failed, **counts)
+        except Exception as e:
+            logger.warning(json.dumps({'event': 'metrics_error', 'stage': name, 'error': repr(e)}))
+        logger.info(json.dumps({
+            'event': 'stage', 'stage': name, 'seconds': round(seconds, 6), **counts,
+            'peak_rss_bytes': rss, 'failed': failed, **fields,
+        }))
+
+# Every stage's aggregates in the Prometheus text exposition format
+def render_prometheus():
+    store = metrics_store()
+    stages = sorted((key[1], store.get(key)) for key in store.iterkeys() if isinstance(key, tuple) and key[0] == 'stage')
+    lines = []
+
+    def family(metric, kind, help_text, samples):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        lines.extend(samples)
+
+    family('gpx_stage_duration_seconds', 'histogram', "Wall time of each pipeline stage.", [
+        sample
+        for name, stats in stages
+        for sample in [
+            *(f'gpx_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {count}'
+              for bound, count in zip(DURATION_BUCKETS, stats['buckets'])),
+            f'gpx_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {stats["count"]}',
+            f'gpx_stage_duration_seconds_sum{{stage="{name}"}} {stats["seconds"]}',
+            f'gpx_stage_duration_seconds_count{{stage="{name}"}} {stats["count"]}',
+        ]
+    ])
+    for metric, key, help_text in [
+        ('gpx_stage_errors_total', 'errors', "Stage runs that raised an error."),
+        ('gpx_stage_points_total', 'points', "Track points processed by each stage."),
+        ('gpx_stage_segments_total', 'segments', "Simulation segments processed by each stage."),
+        ('gpx_stage_integration_steps_total', 'steps', "Integration steps taken by each stage."),
+    ]:
+        family(metric, 'counter', help_text, [f'{metric}{{stage="{name}"}} {stats[key]}' for name, stats in stages])
+    family('gpx_stage_peak_rss_bytes', 'gauge', "Highest peak resident memory seen during each stage.", [
+        f'gpx_stage_peak_rss_bytes{{stage="{name}"}} {stats["peak_rss"]}' for name, stats in stages
+    ])
+    return '\n'.join(lines) + '\n'
+
+# Profiling is opt-in: with PROFILE_DIR set, POST /metrics/profile arms it and the next
+# profiled request, in whichever process runs it, dumps a cProfile file there
+def arm_profile():
+    metrics_store().set('profile-armed', True)
+
+@contextmanager
+def profiled(label):
+    directory = os.environ.get('PROFILE_DIR')
+    if not directory or not metrics_store().pop('profile-armed', default=False):
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{label}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof")
+        profiler.dump_stats(path)
+        logger.info(json.dumps({'event': 'profile', 'label': label, 'path': path}))
+
+def register_metrics_endpoint(server):
+    @server.route('/metrics')
+    def metrics():
+        return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+    @server.route('/metrics/profile', methods=['POST'])
+    def profile_next_request():
+        if not os.environ.get('PROFILE_DIR'):
+            return Response("Profiling is disabled, set PROFILE_DIR to enable it.\n", status=404, mimetype='text/plain')
+        arm_profile()
+        return Response("The next route upload or simulation will be profiled.\n", status=202, mimetype='text/plain')
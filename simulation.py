@@ -0,0 +1,254 @@
+import math
+import numpy as np
+
+GRAVITY = 9.8067
+
+# Integration step (s) used for a segment, chosen from its gradient
+def segment_time_steps(gradients):
+    return np.select([gradients > 20, gradients > 10], [0.025, 0.05], default=0.1)
+
+# Per-segment quantities that only depend on the route, shared by every simulation of it
+def segment_geometry(gradients):
+    gradients = np.asarray(gradients, dtype=float)
+    slopes = np.arctan(gradients / 100)
+    return {
+        'cos_slope': np.cos(slopes),
+        'sin_slope': np.sin(slopes),
+        'time_steps': segment_time_steps(gradients),
+    }
+
+# Collapse runs of consecutive segments whose gradients lie within tolerance (%) of each
+# other into single segments of the same total length and elevation change. The first
+# segment, which only marks the start, is kept on its own.
+# Returns the merged gradients and distances, and for every original segment the index
+# of the merged segment that contains it.
+def merge_segments(gradients, distances, tolerance):
+    if tolerance < 0:
+        raise ValueError("The merge tolerance must not be negative")
+    gradients = np.asarray(gradients, dtype=float)
+    distances = np.asarray(distances, dtype=float)
+    n = len(gradients)
+    segment_index = np.zeros(n, dtype=np.intp)
+    if n < 2:
+        return gradients.copy(), distances.copy(), segment_index
+
+    # Greedy pass: a segment joins the current run while the run's gradient range stays
+    # within tolerance; a segment without gradient (NaN) always stands alone
+    run = 0
+    low = high = math.nan
+    index = segment_index.tolist()
+    for i, gradient in enumerate(gradients.tolist()[1:], start=1):
+        low_candidate = min(low, gradient)
+        high_candidate = max(high, gradient)
+        if gradient != gradient or not high_candidate - low_candidate <= tolerance:
+            run += 1
+            low_candidate = high_candidate = gradient
+        low, high = low_candidate, high_candidate
+        index[i] = run
+    segment_index = np.asarray(index, dtype=np.intp)
+
+    # Length-weighted gradient keeps the elevation change of every run
+    merged_distances = np.bincount(segment_index, weights=distances)
+    rises = np.bincount(segment_index, weights=gradients * distances)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        merged_gradients = np.where(merged_distances > 0, rises / merged_distances, gradients[np.searchsorted(segment_index, np.arange(run + 1))])
+    merged_gradients[0] = gradients[0]
+    return merged_gradients, merged_distances, segment_index
+
+# Spread per-segment results computed on merged segments back over the original segments:
+# exit speeds are repeated, times are shared out by length and the step count of a merged
+# segment is reported on the last original segment it contains
+def expand_segments(results, segment_index, distances):
+    speeds, segment_distances, segment_times, step_counts = results
+    distances = np.asarray(distances, dtype=float)
+    merged_distances = np.bincount(segment_index, weights=distances)[segment_index]
+    counts = np.bincount(segment_index)[segment_index]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = np.where(merged_distances > 0, distances / merged_distances, 1 / counts)
+    expanded_steps = np.zeros(len(segment_index), dtype=step_counts.dtype)
+    last = np.flatnonzero(np.diff(segment_index, append=len(step_counts)))
+    expanded_steps[last] = step_counts[segment_index[last]]
+    return (
+        speeds[segment_index],
+        np.where(np.isnan(segment_distances[segment_index]), np.nan, distances),
+        segment_times[segment_index] * share,
+        expanded_steps,
+    )
+
+# Fixed-step scheme: steps of the gradient-keyed time step, the last one shortened to end on the segment
+def integrate_fixed(powers, resistance_coeffs, distances, time_steps, drag_coeff, total_mass, tolerance, results, progress):
+    speeds, segment_distances, segment_times, step_counts = results
+    n = len(powers)
+    sqrt = math.sqrt
+    progress_every = max(1, n // 100)
+    actual_speed = 0.0
+    for i in range(1, n):
+        if progress is not None and i % progress_every == 0:
+            progress(i, n)
+        actual_power = powers[i]
+        resistance_coeff = resistance_coeffs[i]
+        segment_distance = distances[i]
+        delta_t = time_steps[i]
+        cum_segment_distance = 0.0
+        cum_segment_time = 0.0
+        steps = 0
+        while True:
+            # Calculate forces and acceleration
+            resistance = drag_coeff * actual_speed**3 + resistance_coeff * actual_speed
+            acceleration = (actual_power - resistance) / total_mass
+
+            delta_d = actual_speed * delta_t + 0.5 * acceleration * delta_t**2
+            actual_speed = sqrt(actual_speed**2 + 2 * acceleration * delta_d)
+            cum_segment_distance += delta_d
+            steps += 1
+            # delta_d is bigger than the actual segment: shorten the last step
+            if cum_segment_distance > segment_distance:
+                cum_segment_distance -= delta_d
+                delta_d = segment_distance - cum_segment_distance
+                cum_segment_distance += delta_d
+                actual_speed = sqrt(actual_speed**2 + 2 * acceleration * delta_d)
+                cum_segment_time += delta_d / actual_speed
+                break
+            cum_segment_time += delta_t
+
+        speeds[i] = actual_speed
+        segment_distances[i] = cum_segment_distance
+        segment_times[i] = cum_segment_time
+        step_counts[i] = steps
+
+# Adaptive scheme: the same dynamics (dv/dt = acceleration, dx/dt = v) written over distance
+# for u = v², du/dx = 2 * acceleration and dt/dx = 1 / v, integrated with an embedded
+# Bogacki-Shampine 3(2) pair whose step size keeps the local error within the relative
+# tolerance. du/dx stays positive at v = 0 whenever the rider pushes, so the speed can
+# never become the square root of a negative number.
+def integrate_adaptive(powers, resistance_coeffs, distances, time_steps, drag_coeff, total_mass, tolerance, results, progress):
+    speeds, segment_distances, segment_times, step_counts = results
+    n = len(powers)
+    sqrt = math.sqrt
+    inf = math.inf
+    progress_every = max(1, n // 100)
+    absolute_tolerance = tolerance * 1e-3
+    u = 0.0
+    h = None
+    for i in range(1, n):
+        if progress is not None and i % progress_every == 0:
+            progress(i, n)
+        power = powers[i]
+        resistance_coeff = resistance_coeffs[i]
+        segment_distance = distances[i]
+        # du/dx = a0 - a3 * v³ - a1 * v
+        a0 = 2 * power / total_mass
+        a3 = 2 * drag_coeff / total_mass
+        a1 = 2 * resistance_coeff / total_mass
+
+        x = 0.0
+        t = 0.0
+        steps = 0
+        if u <= 0 and segment_distance > 0:
+            # Standing start: over a short distance the acceleration is power / mass,
+            # so v = sqrt(2 a x) and t = sqrt(2 x / a)
+            acceleration = power / total_mass
+            if acceleration <= 0:
+                raise ValueError("The rider cannot start moving on this segment")
+            x = min(segment_distance, 0.01)
+            u = 2 * acceleration * x
+            t = sqrt(2 * x / acceleration)
+            steps += 1
+        # The first step size is the length of the first segment that has one
+        if h is None and segment_distance > 0:
+            h = segment_distance
+
+        while segment_distance - x > 1e-9 * segment_distance:
+            # The step is cut at the end of the segment without shrinking the step size carried over
+            step = min(h, segment_distance - x)
+            v1 = sqrt(u)
+            k1 = a0 - (a3 * v1 * v1 + a1) * v1
+            u2 = u + 0.5 * step * k1
+            v2 = sqrt(u2) if u2 > 0 else 0.0
+            k2 = a0 - (a3 * v2 * v2 + a1) * v2
+            u3 = u + 0.75 * step * k2
+            v3 = sqrt(u3) if u3 > 0 else 0.0
+            k3 = a0 - (a3 * v3 * v3 + a1) * v3
+            u_new = u + step * (2 / 9 * k1 + 1 / 3 * k2 + 4 / 9 * k3)
+            steps += 1
+
+            if v2 > 0 and v3 > 0 and u_new > 0:
+                v4 = sqrt(u_new)
+                k4 = a0 - (a3 * v4 * v4 + a1) * v4
+                u_error = step * (-5 / 72 * k1 + 1 / 12 * k2 + 1 / 9 * k3 - 1 / 8 * k4)
+                # Time is integrated alongside with the same stages, dt/dx = 1 / v
+                delta_t = step * (2 / 9 / v1 + 1 / 3 / v2 + 4 / 9 / v3)
+                t_error = step * (-5 / 72 / v1 + 1 / 12 / v2 + 1 / 9 / v3 - 1 / 8 / v4)
+                error = max(
+                    abs(u_error) / (tolerance * max(u, u_new) + absolute_tolerance),
+                    abs(t_error) / (tolerance * delta_t + absolute_tolerance),
+                )
+            else:
+                error = inf
+
+            # Grow or shrink the step size from the error estimate of this step
+            factor = min(5.0, max(0.2, 0.9 * error**(-1 / 3))) if error > 0 else 5.0
+            if error <= 1:
+                x += step
+                u = u_new
+                t += delta_t
+                h = max(h, step * factor) if step < h else step * factor
+            else:
+                h = step * factor
+            if h < 1e-9 * max(segment_distance, 1.0):
+                raise ValueError("Adaptive integration step became too small")
+
+        speeds[i] = sqrt(u)
+        segment_distances[i] = segment_distance
+        segment_times[i] = t
+        step_counts[i] = steps
+
+# Integration schemes selectable in simulate_segments
+INTEGRATORS = {
+    'fixed': integrate_fixed,
+    'adaptive': integrate_adaptive,
+}
+
+# Run the ride simulation over plain arrays
+def simulate_segments(gradients, distances, segment_power, total_mass, C_r, C_d, A, rho,
+                      progress=None, geometry=None, method='fixed', tolerance=1e-4):
+    """
+    Integrate the rider speed segment by segment.
+
+    Args:
+    gradients: gradient (%) of every segment
+    distances: length (m) of every segment
+    segment_power: power (W) held on every segment
+    total_mass: rider + bike mass (kg)
+    C_r, C_d, A, rho: rolling coefficient, drag coefficient, frontal area, air density
+    progress: optional function called with (segments done, total segments) about 100 times
+    geometry: segment_geometry of the gradients, when already computed
+    method: 'fixed', the original fixed time step scheme, or 'adaptive'
+    tolerance: relative local error allowed per step by the 'adaptive' method
+
+    Returns arrays of exit speed, simulated distance, time and integration steps per segment.
+    The first entry of each array is NaN (0 steps), as the first point only marks the start.
+    """
+    if method not in INTEGRATORS:
+        raise ValueError(f"Unknown integration method '{method}'")
+    gradients = np.asarray(gradients, dtype=float)
+    n = len(gradients)
+    speeds = np.full(n, np.nan)
+    segment_distances = np.full(n, np.nan)
+    segment_times = np.full(n, np.nan)
+    step_counts = np.zeros(n, dtype=int)
+    results = (speeds, segment_distances, segment_times, step_counts)
+    if n < 2:
+        return results
+
+    # Everything that only depends on the segment is computed once, up front
+    if geometry is None:
+        geometry = segment_geometry(gradients)
+    resistance_coeffs = (total_mass * GRAVITY * (C_r * geometry['cos_slope'] + geometry['sin_slope'])).tolist()
+    time_steps = geometry['time_steps'].tolist()
+    distances = np.asarray(distances, dtype=float).tolist()
+    powers = np.asarray(segment_power, dtype=float).tolist()
+    drag_coeff = 0.5 * C_d * A * rho
+
+    INTEGRATORS[method](powers, resistance_coeffs, distances, time_steps, drag_coeff, total_mass, tolerance, results, progress)
+    return results
@@ -0,0 +1,139 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from cache import evict_oldest
+
+# Default size budget of the route store (bytes)
+DEFAULT_MAX_BYTES = 2**30
+
+METADATA_FILE = 'route.json'
+
+
+class RouteStore:
+    """
+    Persistent store of processed routes, keyed by the hash of the uploaded file.
+
+    Every route is a directory holding one .npy file per build_dataframe column and a
+    small JSON description. Columns are loaded memory-mapped and read-only, so reopening
+    a route costs a few page faults instead of a parse, and every process reading the
+    same route shares its pages through the OS page cache. Loads refresh the
+    directory's modification time, which drives least-recently-used eviction beyond
+    max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        if not key or os.sep in key or key.startswith('.'):
+            raise ValueError(f"Invalid route key '{key}'")
+        return os.path.join(self.directory, key)
+
+    def __contains__(self, key):
+        return os.path.exists(os.path.join(self._path(key), METADATA_FILE))
+
+    def save(self, key, data, name=None):
+        path = self._path(key)
+        description = {
+            'key': key,
+            'name': name or key[:12],
+            'points': len(data),
+            'distance_km': round(float(data['Cumulative Distance (m)'].iloc[-1]) / 1000, 1) if len(data) else 0.0,
+            'columns': list(data.columns),
+            'saved': time.time(),
+        }
+        # Written to a temporary directory and renamed into place, so readers never
+        # see a half-written route; a failed write only means a parse next time
+        tmp_path = None
+        try:
+            tmp_path = tempfile.mkdtemp(dir=self.directory, prefix='.tmp-')
+            for i, column in enumerate(data.columns):
+                np.save(os.path.join(tmp_path, f'{i}.npy'), data[column].to_numpy())
+            with open(os.path.join(tmp_path, METADATA_FILE), 'w') as f:
+                json.dump(description, f)
+            os.rename(tmp_path, path)
+            tmp_path = None
+        except OSError:
+            # Also the case when another worker stored the same route first
+            return
+        finally:
+            if tmp_path is not None:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        self._evict()
+
+    def describe(self, key):
+        try:
+            with open(os.path.join(self._path(key), METADATA_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load(self, key):
+        description = self.describe(key)
+        if description is None:
+            return None
+        path = self._path(key)
+        try:
+            columns = {
+                column: np.load(os.path.join(path, f'{i}.npy'), mmap_mode='r')
+                for i, column in enumerate(description['columns'])
+            }
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        # copy=False keeps every column backed by its memory map
+        import pandas as pd
+        return pd.DataFrame(columns, copy=False)
+
+    # Descriptions of the stored routes, most recently used first; only those of keys when given
+    def list(self, keys=None):
+        if keys is None:
+            keys = [
+                entry.name for entry in os.scandir(self.directory)
+                if not entry.name.startswith('.') and entry.is_dir()
+            ]
+        routes = []
+        for key in keys:
+            description = self.describe(key)
+            if description is None:
+                continue
+            try:
+                description['used'] = os.stat(self._path(key)).st_mtime
+            except OSError:
+                continue
+            routes.append(description)
+        return sorted(routes, key=lambda route: route['used'], reverse=True)
+
+    def delete(self, key):
+        shutil.rmtree(self._path(key), ignore_errors=True)
+
+    def _size(self, path):
+        size = 0
+        for entry in os.scandir(path):
+            try:
+                size += entry.stat().st_size
+            except OSError:
+                pass
+        return size
+
+    def _evict(self):
+        evict_oldest(self.directory, self.max_bytes, self._entry_size, shutil.rmtree)
+
+    def _entry_size(self, entry):
+        if entry.name.startswith('.') or not entry.is_dir():
+            return None
+        return self._size(entry.path)
+
+
+# Build the route store configured through the environment: ROUTE_STORE_DIR and ROUTE_STORE_MAX_BYTES
+def create_route_store():
+    directory = os.environ.get('ROUTE_STORE_DIR', os.path.join(tempfile.gettempdir(), 'gpx-visualizer-routes'))
+    max_bytes = int(os.environ.get('ROUTE_STORE_MAX_BYTES', DEFAULT_MAX_BYTES))
+    return RouteStore(directory, max_bytes)
@@ -0,0 +1,29 @@
+import base64
+import os
+import sys
+
+import pytest
+
+# The app's modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Rider configuration of a simulate_sweep run
+@pytest.fixture
+def rider():
+    return dict(ftp=240, bike_mass=11, rider_mass=88, C_r=0.0036, C_d=0.55, A=0.6, rho=1.225, strategy='zone2')
+
+
+# Upload contents of a track along a meridian, one point every ~11 m, None for a point without <ele>
+def gpx_upload(elevations):
+    points = ''.join(
+        f'<trkpt lat="{45 + i * 1e-4:.4f}" lon="7.0">' + (f'<ele>{ele}</ele>' if ele is not None else '') + '</trkpt>'
+        for i, ele in enumerate(elevations)
+    )
+    gpx = f'<gpx xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>{points}</trkseg></trk></gpx>'
+    return 'data:application/gpx+xml;base64,' + base64.b64encode(gpx.encode()).decode()
+
+
+@pytest.fixture
+def upload():
+    return gpx_upload
@@ -0,0 +1,22 @@
+import hashlib
+import os
+
+import cache
+
+
+def test_content_key_hashes_strings_in_slices_like_their_encoding(monkeypatch):
+    monkeypatch.setattr(cache, 'HASH_CHUNK', 3)
+    for contents in ['', 'a', 'data:;base64,AbC', 'éè€ with multibyte characters across slices']:
+        assert cache.content_key(contents) == hashlib.sha256(contents.encode('utf-8')).hexdigest()
+    assert cache.content_key(b'raw bytes') == hashlib.sha256(b'raw bytes').hexdigest()
+
+
+def test_disk_cache_evicts_the_least_recently_used_entries(tmp_path):
+    disk_cache = cache.DiskCache(str(tmp_path), max_bytes=2500)
+    for number, name in enumerate(['old', 'used', 'new']):
+        disk_cache.set(name, b'x' * 1000)
+        os.utime(disk_cache._path(name), (number, number))
+    os.utime(disk_cache._path('used'), (10, 10))
+    disk_cache._evict()
+    assert disk_cache.get('old') is None
+    assert disk_cache.get('used') is not None and disk_cache.get('new') is not None
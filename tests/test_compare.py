@@ -0,0 +1,21 @@
+import diskcache
+
+from compare import summarise_uploads
+
+
+# Upload spool whose disk cache times out for one of the uploads
+class LockedSpool(dict):
+    def get(self, key, default=None):
+        if key == 'locked':
+            raise diskcache.Timeout("database is locked")
+        return super().get(key, default)
+
+
+def test_a_failing_route_only_fails_its_own_row(upload, rider):
+    spool = LockedSpool(good=upload([100, 101, 103, 102, 104, 106]))
+    uploads = [('locked', 'locked.gpx'), ('good', 'good.gpx')]
+    summaries = dict(summarise_uploads(uploads, rider, workers=1, spool=spool))
+
+    assert summaries[0] == {'name': 'locked.gpx', 'error': 'database is locked'}
+    assert summaries[1]['name'] == 'good.gpx'
+    assert summaries[1]['time_s'] > 0
@@ -0,0 +1,22 @@
+import diskcache
+import pytest
+
+import metrics
+
+
+def failing_record_stage(*args, **kwargs):
+    raise diskcache.Timeout("database is locked")
+
+
+def test_stage_keeps_its_result_when_metrics_cannot_be_recorded(monkeypatch, caplog):
+    monkeypatch.setattr(metrics, 'record_stage', failing_record_stage)
+    with metrics.stage('parse_gpx') as counts:
+        counts['points'] = 10
+    assert 'metrics_error' in caplog.text
+
+
+def test_stage_error_is_not_replaced_when_metrics_cannot_be_recorded(monkeypatch):
+    monkeypatch.setattr(metrics, 'record_stage', failing_record_stage)
+    with pytest.raises(ValueError, match="bad GPX"):
+        with metrics.stage('parse_gpx'):
+            raise ValueError("bad GPX")
@@ -0,0 +1,39 @@
+import base64
+import gzip
+
+import numpy as np
+import pytest
+
+from data_processing import parse_gpx, build_dataframe, simulate_sweep
+
+
+def test_missing_elevations_are_interpolated_along_the_track(upload, rider):
+    latitudes, longitudes, elevations = parse_gpx(upload([None, 100, None, 104, 106, None]))
+    np.testing.assert_allclose(elevations, [100, 100, 102, 104, 106, 106], atol=1e-6)
+
+    # The route simulates like any other
+    data = build_dataframe((latitudes, longitudes, elevations))
+    assert simulate_sweep(data, [rider])['time_s'].iloc[0] > 0
+
+
+def test_track_without_elevations_is_rejected(upload):
+    with pytest.raises(ValueError, match="no elevation data"):
+        parse_gpx(upload([None, None, None]))
+
+
+# Gzip-compressed version of an upload
+def gzip_upload(contents):
+    gpx = base64.b64decode(contents.partition(',')[2])
+    return 'data:application/gzip;base64,' + base64.b64encode(gzip.compress(gpx)).decode()
+
+
+def test_gzip_upload_within_the_limit_is_parsed(monkeypatch, upload):
+    monkeypatch.setenv('GPX_MAX_BYTES', '4096')
+    _, _, elevations = parse_gpx(gzip_upload(upload([100, 101, 102])))
+    np.testing.assert_allclose(elevations, [100, 101, 102])
+
+
+def test_gzip_upload_expanding_beyond_the_limit_is_rejected(monkeypatch, upload):
+    monkeypatch.setenv('GPX_MAX_BYTES', '4096')
+    with pytest.raises(ValueError, match="too large"):
+        parse_gpx(gzip_upload(upload([100] * 1000)))
@@ -0,0 +1,106 @@
+import math
+
+import numpy as np
+import pytest
+
+from data_processing import build_dataframe, create_pacing, simulate_sweep, update_speed_pacing
+
+RIDER = dict(ftp=240, bike_mass=11, rider_mass=88, C_r=0.0036, C_d=0.55, A=0.6, rho=1.225)
+PACING_FACTORS = {'zone1': 0.5, 'zone2': 0.7, 'zone3': 0.85, 'push_hard': 1}
+SERIES = ['updated_speed', 'updated_pacing_time', 'updated_power', 'cum_pacing_time']
+
+
+# The original row-by-row simulation, kept as the reference the array version must match
+def reference_update_speed_pacing(data, ftp, bike_mass, rider_mass, C_r, C_d, A, rho, strategy):
+    W = bike_mass + rider_mass
+    pacing = create_pacing(PACING_FACTORS[strategy])
+    power = ftp
+
+    for i in range(1, len(data)):
+        if i == 1:
+            actual_speed = 0
+        else:
+            actual_speed = data.iloc[i-1]['updated_speed']
+        actual_power = power * pacing.loc[max(min(int(data.loc[i, 'Gradient (%)']), 15), -15)].values[0]
+        cum_segment_distance = 0
+        cum_segment_time = 0
+        if data.loc[i, 'Gradient (%)'] > 20:
+            delta_t = 0.025
+        elif data.loc[i, 'Gradient (%)'] > 10:
+            delta_t = 0.05
+        else:
+            delta_t = 0.1
+        last_step = False
+        while not last_step:
+            air_resistance = 0.5 * C_d * A * rho * actual_speed**3
+            rolling_resistance = C_r * W * 9.8067 * math.cos(math.atan(data.iloc[i]['Gradient (%)']/100)) * actual_speed
+            gravity_resistance = W * 9.8067 * math.sin(math.atan(data.iloc[i]['Gradient (%)']/100)) * actual_speed
+            net_force = actual_power - (air_resistance + rolling_resistance + gravity_resistance)
+            acceleration = net_force / W
+
+            delta_d = actual_speed * delta_t + 0.5 * acceleration * delta_t**2
+            actual_speed = math.sqrt(actual_speed**2 + 2 * acceleration * delta_d)
+            cum_segment_distance += delta_d
+            if cum_segment_distance > data.iloc[i]['Distance (m)']:
+                last_step = True
+                cum_segment_distance -= delta_d
+                delta_d = data.iloc[i]['Distance (m)'] - (cum_segment_distance)
+                cum_segment_distance += delta_d
+                actual_speed = math.sqrt(actual_speed**2 + 2 * acceleration * delta_d)
+                delta_t = delta_d / actual_speed
+
+            cum_segment_time += delta_t
+
+        data.at[i, 'updated_speed'] = actual_speed
+        data.at[i, 'updated_distance'] = cum_segment_distance
+        data.at[i, 'updated_pacing_time'] = cum_segment_time
+        data.at[i, 'updated_power'] = actual_power
+
+    data['updated_power'] = data['updated_power'].bfill()
+    data.at[0, 'updated_pacing_time'] = 3.1
+    data['cum_pacing_time'] = data['updated_pacing_time'].cumsum()
+    return data
+
+
+# Short route of climbs and descents, gradients up to ±14 %
+def synthetic_route(points=150, seed=0):
+    rng = np.random.default_rng(seed)
+    latitudes = 45.0 + np.cumsum(rng.uniform(0.5, 1.5, points)) * 1e-4
+    longitudes = np.full(points, 7.0)
+    steps = np.diff(latitudes, prepend=latitudes[0]) * 111000
+    gradients = 13 * np.sin(np.arange(points) / 12) + rng.uniform(-1, 1, points)
+    elevations = 300 + np.cumsum(steps * gradients / 100)
+    return build_dataframe((latitudes, longitudes, elevations), distance_method='haversine')
+
+
+@pytest.mark.parametrize('strategy', list(PACING_FACTORS))
+def test_update_speed_pacing_matches_reference_loop(strategy):
+    data = synthetic_route()
+    expected = reference_update_speed_pacing(data.copy(), **RIDER, strategy=strategy)
+    update_speed_pacing(data, **RIDER, strategy=strategy)
+    for column in SERIES:
+        np.testing.assert_allclose(data[column], expected[column], rtol=1e-9, atol=1e-9, equal_nan=True, err_msg=column)
+
+
+@pytest.mark.parametrize('merge_tolerance', [None, 1])
+def test_sweep_series_match_update_speed_pacing(merge_tolerance):
+    data = synthetic_route()
+    configs = [dict(RIDER, strategy=strategy) for strategy in PACING_FACTORS]
+    results, series = simulate_sweep(data, configs, merge_tolerance=merge_tolerance, series=True)
+    assert results.equals(simulate_sweep(data, configs, merge_tolerance=merge_tolerance))
+    for config, ride in zip(configs, series):
+        expected = data.copy()
+        update_speed_pacing(expected, **config, merge_tolerance=merge_tolerance)
+        for column in SERIES:
+            np.testing.assert_allclose(ride[column], expected[column], rtol=1e-12, equal_nan=True, err_msg=column)
+
+
+def test_adaptive_method_starts_after_repeated_track_points():
+    data = synthetic_route()
+    # A device that records the start twice gives a first segment of zero length
+    data = data.iloc[[0, 0, 0] + list(range(1, len(data)))].reset_index(drop=True)
+    data = build_dataframe((data['Latitude'], data['Longitude'], data['Elevation (m)']), distance_method='haversine')
+    expected = data.copy()
+    update_speed_pacing(expected, **RIDER, strategy='zone2')
+    update_speed_pacing(data, **RIDER, strategy='zone2', method='adaptive', tolerance=1e-6)
+    assert data['cum_pacing_time'].iloc[-1] == pytest.approx(expected['cum_pacing_time'].iloc[-1], rel=1e-2)
@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+
+from data_processing import savitzky_golay_elevation, track_distance
+
+
+# Steady 8 % climb to the finish along a meridian, points about 7 to 17 m apart
+def linear_climb(points=120, seed=0):
+    rng = np.random.default_rng(seed)
+    latitudes = 45.0 + np.cumsum(rng.uniform(0.6, 1.5, points)) * 1e-4
+    longitudes = np.full(points, 7.0)
+    elevations = 300 + 0.08 * track_distance(latitudes, longitudes)
+    return latitudes, longitudes, elevations
+
+
+@pytest.mark.parametrize('window', [50.0, 100.0, 200.0])
+def test_savitzky_golay_keeps_a_linear_profile_up_to_its_ends(window):
+    latitudes, longitudes, elevations = linear_climb()
+    _, _, smoothed = savitzky_golay_elevation(latitudes, longitudes, elevations, window=window)
+    np.testing.assert_allclose(smoothed, elevations, atol=1e-6)
@@ -0,0 +1,18 @@
+import os
+
+import numpy as np
+
+from data_processing import build_dataframe
+from store import RouteStore
+
+
+def test_route_store_removes_the_least_recently_opened_routes(tmp_path):
+    data = build_dataframe((45 + np.arange(100) * 1e-4, np.full(100, 7.0), np.linspace(300, 320, 100)))
+    store = RouteStore(str(tmp_path))
+    for number, key in enumerate(['old', 'opened', 'new']):
+        store.save(key, data, key)
+        os.utime(tmp_path / key, (number, number))
+    store.load('opened')
+    store.max_bytes = 2.5 * store._size(str(tmp_path / 'new'))
+    store._evict()
+    assert [route['key'] for route in store.list()] == ['opened', 'new']